@@ -1,14 +1,32 @@
+import asyncio
+import hashlib
+import mmap
 import os
+import pathlib
 import time
-import sys
-import re
-from openai import OpenAI
-from anthropic import Anthropic, AuthenticationError, APIError, RateLimitError
-from dotenv import load_dotenv
+from collections import OrderedDict, deque
 import gradio as gr
 
-# Import our multi-model workflow
-from multi_model_workflow import ai_collaboration
+# Use uvloop for the uvicorn server when available (not supported on Windows);
+# uvicorn likewise picks up httptools automatically once installed
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+# The shared engine owns the API clients, retries, caching and the
+# collaboration pipeline; this module is just the web UI on top of it
+from llm_engine import (
+    CLAUDE_MODEL,
+    OPENAI_MODEL,
+    CLAUDE_DISPLAY,
+    OPENAI_DISPLAY,
+    ai_collaboration,
+    ai_compare,
+    is_trivial_prompt,
+    prewarm_connections,
+)
 
 """
 chat_gui.py
@@ -23,61 +41,140 @@ Usage:
     python chat_gui.py
 """
 
-# Load .env if present
-load_dotenv()
-
-# Grab keys and configuration from environment
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Check for API keys
-if not ANTHROPIC_API_KEY:
-    print("ERROR: Missing ANTHROPIC_API_KEY environment variable.")
-    print("Make sure to create a .env file with your API keys.")
-    sys.exit(1)
-if not OPENAI_API_KEY:
-    print("ERROR: Missing OPENAI_API_KEY environment variable.")
-    print("Make sure to create a .env file with your API keys.")
-    sys.exit(1)
-
-# Get model names from environment variables with defaults
-CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-3-7-sonnet-20250219")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "o3-mini")
-
-print(f"Using Claude model: {CLAUDE_MODEL}")
-print(f"Using OpenAI model: {OPENAI_MODEL}")
-
-# Initialize API clients using modern formats
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-# Persistent conversation memory for the session
-conversation_memory = []
+# Persistent conversation memory for the session. A bounded deque evicts the
+# oldest entry in O(1) when full, with no explicit length check needed.
+# The entry count is only a coarse ceiling; the real cap is a token budget
+# (below), since one verbose entry can cost more than ten short ones.
 MAX_MEMORY_ENTRIES = 10  # Limit to prevent very long contexts
+conversation_memory = deque(maxlen=MAX_MEMORY_ENTRIES)
+
+# Token budgets for the stored memory: a per-session ceiling enforced at
+# insert time, and a per-entry cap applied when the history is rendered so
+# one huge answer can't crowd out every other turn
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "5000"))
+MEMORY_TURN_TOKENS = int(os.getenv("MEMORY_TURN_TOKENS", "750"))
+
+# Bound how many past turns the chat keeps; the full history is re-serialized
+# to the browser on every streamed yield
+MAX_HISTORY = int(os.getenv("MAX_HISTORY", "50"))
+
+# Gradio queue sizing: how many turns may run concurrently (the LLM calls are
+# async, so overlapping sessions mostly wait on the providers) and how many
+# may wait in line before new submissions are rejected
+QUEUE_CONCURRENCY = int(os.getenv("QUEUE_CONCURRENCY", "8"))
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "64"))
+
+# Token budget for the history injected into each prompt. Without it, every
+# turn's prompt grows with the whole session, so cost per turn rises
+# quadratically over a session. Uses the ~4 chars/token heuristic.
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "2000"))
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) - no tokenizer needed"""
+    return len(text) // 4 + 1
+
+# Upload limits, evaluated once at import rather than per call
+MAX_FILE_SIZE = 1024 * 1024  # 1MB limit
+MAX_CONTENT_LENGTH = 20000  # ~20KB of text
+
+# Paragraphs at least this long are fingerprinted so that blocks repeated
+# across turns (re-pasted file contents, restated requirements) are injected
+# once and back-referenced afterwards instead of re-spending input tokens
+DEDUP_MIN_PARAGRAPH_CHARS = 80
+
+def dedup_entry_content(content, label, seen):
+    """
+    Replace paragraphs already emitted earlier in this history with a short
+    back-reference. `seen` maps paragraph fingerprint -> label of the turn
+    that first carried it, shared across one format_conversation_history call.
+    """
+    out = []
+    for paragraph in content.split("\n\n"):
+        if len(paragraph) >= DEDUP_MIN_PARAGRAPH_CHARS:
+            digest = hashlib.blake2b(paragraph.encode(), digest_size=8).hexdigest()
+            if digest in seen:
+                out.append(f"[ref:{digest}] (unchanged from the {seen[digest]} entry above)")
+                continue
+            seen[digest] = label
+        out.append(paragraph)
+    return "\n\n".join(out)
+
+# LRU cache of fully rendered turns, so re-submitting an identical prompt
+# (+file, +context, +mode) replays instantly with zero API spend. Shares the
+# engine's RESPONSE_CACHE opt-in: with temperature above zero, serving a
+# stored answer changes behaviour, so it's off unless explicitly enabled.
+RENDER_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "32"))
+_render_cache = OrderedDict()
+
+def render_cache_key(mode, user_message, file_content, conversation_context):
+    """Fingerprint everything that shapes the rendered turn"""
+    material = "\x1f".join((mode, user_message, file_content or "", conversation_context))
+    return hashlib.blake2b(material.encode(), digest_size=16).hexdigest()
 
 def update_memory(role, content):
     """Add a new entry to the conversation memory with metadata"""
+    # Entropy gate: one-or-two-word turns ("ok", "thanks") carry no context
+    # worth recalling later, so don't spend a memory slot on them
+    if len(set(content.split())) < 3:
+        return
     conversation_memory.append({
         "role": role,
         "content": content,
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+        "tokens": estimate_tokens(content),
+        # Raw epoch; formatting is deferred to the entries actually rendered
+        "timestamp": int(time.time())
     })
-    
-    # If we exceed the max entries, remove the oldest one (but keep at least one entry)
-    if len(conversation_memory) > MAX_MEMORY_ENTRIES:
-        conversation_memory.pop(0)
+    # Evict oldest entries until the session fits its token budget
+    while len(conversation_memory) > 1 and sum(e["tokens"] for e in conversation_memory) > MEMORY_TOKEN_BUDGET:
+        conversation_memory.popleft()
+
+def history_pack_version(pack):
+    """Short stable fingerprint of a rendered history pack"""
+    return hashlib.blake2b(pack.encode(), digest_size=8).hexdigest()
 
 def format_conversation_history():
-    """Format the memory into a string for the models to process"""
+    """
+    Format the memory into a string for the models to process, keeping a
+    sliding window of the most recent entries that fit MAX_CONTEXT_TOKENS.
+
+    The output is deterministic for a given memory state - entries render in
+    insertion order with no timestamps - so consecutive turns share a byte-
+    identical prefix and provider-side prompt caches can recognize it.
+    """
     if not conversation_memory:
         return ""
-    
-    history = "--- Previous Conversation History ---\n\n"
-    for entry in conversation_memory:
-        history += f"[{entry['role']}] ({entry['timestamp']}): {entry['content']}\n\n"
-    history += "--- End of History ---\n\n"
-    
-    return history
+
+    # Walk newest-first until the token budget runs out, then restore order
+    kept = []
+    budget = MAX_CONTEXT_TOKENS
+    for entry in reversed(conversation_memory):
+        cost = min(entry["tokens"], MEMORY_TURN_TOKENS)
+        if cost > budget and kept:
+            break
+        budget -= cost
+        kept.append(entry)
+    kept.reverse()
+
+    # One join over a parts list instead of repeated string concatenation.
+    # Long paragraphs repeated across turns (re-pasted files, restated specs)
+    # are injected once and back-referenced afterwards.
+    seen = {}
+    parts = ["--- Previous Conversation History ---"]
+    for position, entry in enumerate(kept, start=1):
+        # Timestamps stay on the stored entries for the UI, but never enter
+        # the model-facing pack - a string that changes every turn would
+        # invalidate any provider-side prompt-prefix cache
+        label = f"{entry['role']} turn {position}"
+        content = entry["content"]
+        # Per-entry cap so one verbose answer can't fill the whole window
+        if entry["tokens"] > MEMORY_TURN_TOKENS:
+            content = content[:MEMORY_TURN_TOKENS * 4] + "..."
+        content = dedup_entry_content(content, label, seen)
+        parts.append(f"[{entry['role']}]: {content}")
+    parts.append("--- End of History ---")
+
+    return "\n\n".join(parts) + "\n\n"
 
 def process_file_content(file_obj):
     """
@@ -88,28 +185,41 @@ def process_file_content(file_obj):
         return None
         
     try:
-        # Check file size
-        MAX_FILE_SIZE = 1024 * 1024  # 1MB limit
-        
-        # Check the file size in memory (for bytes) or on disk
         if isinstance(file_obj, bytes):
-            file_size = len(file_obj)
+            if len(file_obj) > MAX_FILE_SIZE:
+                return "ERROR: File exceeds the maximum size limit of 1MB."
+            truncated = len(file_obj) > MAX_CONTENT_LENGTH
+            # memoryview slice avoids copying the tail that gets discarded;
+            # a few spare bytes let the cut land on a codepoint boundary
+            raw = memoryview(file_obj)[:MAX_CONTENT_LENGTH + 4].tobytes()
         else:
-            file_obj.seek(0, os.SEEK_END)
-            file_size = file_obj.tell()
-            file_obj.seek(0)
-            
-        if file_size > MAX_FILE_SIZE:
-            return "ERROR: File exceeds the maximum size limit of 1MB."
-            
-        # Extract content - assume text file
-        file_content = file_obj.decode("utf-8") if isinstance(file_obj, bytes) else file_obj.read().decode("utf-8")
-        
-        # Truncate if it's extremely long
-        MAX_CONTENT_LENGTH = 20000  # ~20KB of text
-        if len(file_content) > MAX_CONTENT_LENGTH:
-            file_content = file_content[:MAX_CONTENT_LENGTH] + "\n...[content truncated due to length]..."
-            
+            # Gradio 4.x hands the handler a filepath (a str subclass), not
+            # an open file - open it ourselves, then one fstat instead of
+            # seek/tell/seek and an mmap of just the bytes we keep instead
+            # of reading the whole file into memory
+            with open(file_obj, "rb") as f:
+                file_size = os.fstat(f.fileno()).st_size
+                if file_size > MAX_FILE_SIZE:
+                    return "ERROR: File exceeds the maximum size limit of 1MB."
+                if file_size == 0:
+                    return ""
+                truncated = file_size > MAX_CONTENT_LENGTH
+                length = min(file_size, MAX_CONTENT_LENGTH + 4)
+                with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as mm:
+                    raw = mm[:length]
+
+        if truncated:
+            # Walk back from the cut to the nearest lead byte (a byte that
+            # isn't a 10xxxxxx continuation) so the slice never splits a
+            # multi-byte character
+            boundary = MAX_CONTENT_LENGTH
+            while boundary > 0 and (raw[boundary] & 0xC0) == 0x80:
+                boundary -= 1
+            file_content = raw[:boundary].decode("utf-8", errors="replace")
+            file_content += "\n...[content truncated due to length]..."
+        else:
+            file_content = raw.decode("utf-8")
+
         return file_content
         
     except UnicodeDecodeError:
@@ -117,206 +227,133 @@ def process_file_content(file_obj):
     except Exception as e:
         return f"ERROR: {str(e)}"
 
-def chat_interface(user_message, file_upload, chat_history):
+async def chat_interface(user_message, file_upload, mode, chat_history):
     """
     Gradio chat function that shows the conversation between the AIs
-    Now processes file uploads and maintains conversation memory
+    Now processes file uploads, maintains conversation memory and supports
+    a parallel Compare mode alongside the default Refine pipeline
     """
-    # Process file if uploaded
+    # Process file if uploaded - disk I/O runs in a worker thread so the
+    # event loop keeps serving other queued sessions meanwhile
     file_content = None
     if file_upload is not None:
         try:
-            file_content = process_file_content(file_upload)
+            file_content = await asyncio.to_thread(process_file_content, file_upload)
             if file_content and file_content.startswith("ERROR:"):
-                chat_history.append((f"File upload: {file_upload.name}", file_content))
-                return "", None, chat_history
+                chat_history.append({"role": "user", "content": f"File upload: {file_upload.name}"})
+                chat_history.append({"role": "assistant", "content": file_content})
+                yield "", None, chat_history, "", ""
+                return
         except Exception as e:
             error_msg = f"⚠️ Error processing file: {str(e)}"
-            chat_history.append((f"File upload: {file_upload.name}", error_msg))
-            return "", None, chat_history
-    
-    # Get conversation context
-    conversation_context = format_conversation_history()
-    
-    # Update chat history with the user message immediately
+            chat_history.append({"role": "user", "content": f"File upload: {file_upload.name}"})
+            chat_history.append({"role": "assistant", "content": error_msg})
+            yield "", None, chat_history, "", ""
+            return
+
+    # Get conversation context - skipped for trivial turns ("hi", "thanks"),
+    # which don't benefit from history and would only pay its input tokens
+    conversation_context = "" if is_trivial_prompt(user_message) else format_conversation_history()
+
+    # Update chat history with the user message immediately, trimming the
+    # oldest messages in place so the re-serialized list stays bounded
     upload_note = f" [with file: {file_upload.name}]" if file_upload else ""
-    chat_history.append((user_message + upload_note, ""))
-    yield "", None, chat_history
-    
-    # Generate responses
-    bot_message = ""
-    for message in ai_collaboration(user_message, file_content, conversation_context):
-        # Update the last message
-        bot_message = message
-        chat_history[-1] = (user_message + upload_note, bot_message)
-        yield "", None, chat_history
-    
-    # Extract content for memory (stripping HTML)
-    if bot_message:
-        # Parse Claude's response from the combined output
-        claude_match = re.search(r'<div class=\'claude-message\'><h3>.*?</h3>\s*\n\n(.*?)\s*</div>', bot_message, re.DOTALL)
-        if claude_match:
-            claude_text = claude_match.group(1).strip()
-            update_memory("Claude", claude_text)
-        
-        # Parse ChatGPT's response from the combined output
-        chatgpt_match = re.search(r'<div class=\'chatgpt-message\'><h3>.*?</h3>\s*\n\n(.*?)\s*</div>', bot_message, re.DOTALL)
-        if chatgpt_match:
-            chatgpt_text = chatgpt_match.group(1).strip()
-            update_memory("ChatGPT", chatgpt_text)
-        
-        # Update user message in memory
+    chat_history.append({"role": "user", "content": user_message + upload_note})
+    chat_history.append({"role": "assistant", "content": ""})
+    if len(chat_history) > MAX_HISTORY:
+        del chat_history[:-MAX_HISTORY]
+    yield "", None, chat_history, "", ""
+
+    # Serve an identical resubmission straight from the render cache
+    cache_key = None
+    if RENDER_CACHE_ENABLED:
+        cache_key = render_cache_key(mode, user_message, file_content, conversation_context)
+        cached = _render_cache.get(cache_key)
+        if cached is not None:
+            _render_cache.move_to_end(cache_key)
+            cached_html, cached_claude, cached_chatgpt = cached
+            chat_history[-1]["content"] = cached_html
+            yield "", None, chat_history, "", ""
+            # A replayed turn is still a turn: record it in memory exactly
+            # like a fresh one, or the next prompt's injected history would
+            # omit an exchange that is visibly on screen
+            if cached_claude:
+                update_memory("Claude", cached_claude)
+            if cached_chatgpt:
+                update_memory("ChatGPT", cached_chatgpt)
+            update_memory("User", user_message + (" [with attached file]" if file_content else ""))
+            return
+
+    # Stream each model's raw text into its own Markdown panel - Gradio
+    # diff-updates the panel per chunk instead of re-sanitizing a growing
+    # HTML blob - and write the rendered transcript into the chatbot once,
+    # when the turn completes. Compare mode queries both models concurrently
+    # instead of chaining Claude into ChatGPT.
+    workflow = ai_compare if mode == "Compare" else ai_collaboration
+    last_update = None
+    async for update in workflow(user_message, file_content, conversation_context):
+        last_update = update
+        if update.claude_text or update.chatgpt_text:
+            # gr.update() with no arguments is a no-op for the other outputs,
+            # so each tick ships only the two panel strings over the
+            # websocket instead of re-serializing the whole chat history
+            claude_panel_md = CLAUDE_PANEL_HEADER + update.claude_text if update.claude_text else ""
+            chatgpt_panel_md = CHATGPT_PANEL_HEADER + update.chatgpt_text if update.chatgpt_text else ""
+            yield gr.update(), gr.update(), gr.update(), claude_panel_md, chatgpt_panel_md
+        else:
+            # Status lines ("⏳ ...") still show in the chat itself
+            chat_history[-1]["content"] = update.html
+            yield "", None, chat_history, "", ""
+
+    if last_update is not None:
+        chat_history[-1]["content"] = last_update.html
+    yield "", None, chat_history, "", ""
+
+    # The final StreamUpdate carries each model's raw text, so memory no
+    # longer needs to regex-parse it back out of the rendered HTML. Error
+    # output (⚠️) never enters memory - the same rule the caches follow -
+    # or it would be re-injected into every later prompt's history.
+    if last_update is not None:
+        if last_update.claude_text and "⚠️" not in last_update.claude_text:
+            update_memory("Claude", last_update.claude_text.strip())
+        if last_update.chatgpt_text and "⚠️" not in last_update.chatgpt_text:
+            update_memory("ChatGPT", last_update.chatgpt_text.strip())
         update_memory("User", user_message + (f" [with attached file]" if file_content else ""))
 
-# Updated CSS to meet the requested refinements
-custom_css = """
-/* 1) Ensure Claude's text is black (or near-black) */
-/* Force Claude's bubble text to true black */
-.claude-message {
-    float: left;
-    clear: both;
-    display: inline-block;
-    max-width: 70%;
-    margin: 10px 0;
-    padding: 10px 15px;
-    border-radius: 16px;
-    background-color: #e5e5ea; /* iMessage-like gray bubble */
-}
-
-.claude-message,
-.claude-message * {
-    color: #000000 !important; /* Force black text on any descendants */
-}
-
-/* Keep code sections dark if desired */
-.claude-message code,
-.claude-message pre {
-    background-color: #2f3136 !important;
-    color: #ffffff !important;
-    border: none !important;
-    padding: 0.5em 0.75em !important;
-    border-radius: 6px !important;
-    font-family: Menlo, Consolas, "DejaVu Sans Mono", monospace !important;
-    white-space: pre-wrap;
-    word-wrap: break-word;
-}
-
-/* ChatGPT bubble remains blue with white text */
-.chatgpt-message {
-    float: right;
-    clear: both;
-    display: inline-block;
-    max-width: 70%;
-    margin: 10px 0;
-    padding: 10px 15px;
-    border-radius: 16px;
-    background-color: #007aff; /* iMessage-like blue bubble */
-    color: #ffffff !important;
-}
-
-/* General container text color */
-.gradio-container {
-    color: #111827 !important;
-}
-
-/* 2) Code blocks + inline code styled closer to ChatGPT's dark look */
-code, pre {
-    background-color: #2f3136 !important;
-    color: #ffffff !important;
-    border: none !important;
-    padding: 0.5em 0.75em !important;
-    border-radius: 6px !important;
-    font-family: Menlo, Consolas, "DejaVu Sans Mono", monospace !important;
-    white-space: pre-wrap;
-    word-wrap: break-word;
-}
-
-/* 3) Placeholder text (example) is light gray + italic, actual typed text is white, non-italic */
-textarea, input {
-    font-style: normal !important;
-    color: #ffffff !important; /* typed text is white */
-    background-color: #111827 !important; /* keep existing background or dark if desired */
-}
-textarea::placeholder, input::placeholder {
-    color: #ccc !important; /* light gray placeholders */
-    font-style: italic;
-}
-
-/* 4) The Clear Chat button is given a lighter gray background to offset from text */
-#clear_btn {
-    background-color: #f0f0f0 !important;
-    color: #111827 !important;
-}
-
-/* 5) Make "Tips for Effective Prompts" white text */
-.gr-accordion-label {
-    color: #ffffff !important;
-}
-
-/* Additional elements remain with good contrast */
-.chat-message {
-    color: #111827 !important;
-}
-.user-message {
-    color: #111827 !important;
-    background-color: #e5e7eb !important;
-}
-.assistant-message {
-    color: #111827 !important;
-}
-.claude-message h3, .chatgpt-message h3 {
-    margin-top: 0;
-    margin-bottom: 8px;
-    font-size: 0.95em;
-    font-weight: 600;
-    border-bottom: none;
-    color: inherit;
-}
-/* 6) Reduce chat height to avoid scrolling for UI controls */
-#chatbot {
-    height: 400px !important;
-}
-
-/* Ensure button text is visible */
-button {
-    color: #111827 !important;
-}
-
-/* File upload area styling */
-.file-upload {
-    margin-top: 10px;
-    margin-bottom: 10px;
-    padding: 10px;
-    border: 2px dashed #ccc;
-    border-radius: 8px;
-    background-color: #f8f9fa;
-}
-
-/* Memory indicator */
-.memory-indicator {
-    font-size: 0.8em;
-    color: #666;
-    text-align: right;
-    margin-bottom: 5px;
-}
-
-/* GitHub section styling */
-.github-section {
-    padding: 10px;
-    background-color: #f4f6f8;
-    border-left: 4px solid #0366d6;
-    margin-bottom: 10px;
-    border-radius: 0 6px 6px 0;
-}
-"""
-
-# Get model display names for UI
-claude_display = CLAUDE_MODEL.split('-')[2].capitalize() if '-' in CLAUDE_MODEL else CLAUDE_MODEL
-openai_display = OPENAI_MODEL.replace("-", " ").title()
+        # Cache the completed render along with the raw texts, so a hit can
+        # replay the memory updates too; error turns (⚠️) are never stored
+        if cache_key is not None and "⚠️" not in last_update.html:
+            _render_cache[cache_key] = (
+                last_update.html,
+                last_update.claude_text.strip(),
+                last_update.chatgpt_text.strip(),
+            )
+            _render_cache.move_to_end(cache_key)
+            while len(_render_cache) > RENDER_CACHE_SIZE:
+                _render_cache.popitem(last=False)
+
+# Headers for the live streaming panels - native Markdown, no HTML wrappers,
+# so Gradio diff-updates each panel instead of re-sanitizing a growing blob
+CLAUDE_PANEL_HEADER = f"### 🟣 Claude ({CLAUDE_DISPLAY})\n\n"
+CHATGPT_PANEL_HEADER = f"### 🟢 ChatGPT ({OPENAI_DISPLAY})\n\n"
+
+# Warm the provider connections once, on the first page load - that runs on
+# the serving event loop, which the pooled connections must belong to
+_pool_warmed = False
+
+async def warm_pool_once():
+    global _pool_warmed
+    if not _pool_warmed:
+        _pool_warmed = True
+        await prewarm_connections()
+
+# The chat styling lives in a static stylesheet, read once at module load
+# instead of shipping a large inline triple-quoted block with the script
+custom_css = (pathlib.Path(__file__).parent / "assets" / "styles.css").read_text(encoding="utf-8")
 
 # Build the Gradio UI
 with gr.Blocks(css=custom_css, theme=gr.themes.Default()) as demo:
-    gr.Markdown(f"# AI Collaboration: Claude ({claude_display}) & ChatGPT ({openai_display})")
+    gr.Markdown(f"# AI Collaboration: Claude ({CLAUDE_DISPLAY}) & ChatGPT ({OPENAI_DISPLAY})")
     gr.Markdown("""
     This interface demonstrates Claude and ChatGPT collaborating directly with each other:
     
@@ -337,19 +374,35 @@ with gr.Blocks(css=custom_css, theme=gr.themes.Default()) as demo:
     chatbot = gr.Chatbot(
         label="AI Collaboration",
         elem_id="chatbot",
+        type="messages",
         bubble_full_width=True,
         height=400,
         show_copy_button=True,
         avatar_images=(None, "🤖")
     )
     
+    # Live streaming panels: each model's answer grows in its own native
+    # Markdown component while it streams; the chatbot above receives the
+    # finished transcript once per turn
+    with gr.Row():
+        claude_panel = gr.Markdown("", elem_classes=["claude-message"])
+        chatgpt_panel = gr.Markdown("", elem_classes=["chatgpt-message"])
+
     # File upload component
     file_upload = gr.File(
         label="Upload a text file (optional, max 1MB)",
         file_count="single",
         file_types=[".txt", ".md", ".py", ".js", ".html", ".css", ".json", ".csv"]
     )
-    
+
+    # Workflow mode: Refine chains Claude -> ChatGPT, Compare asks both at once
+    mode = gr.Radio(
+        ["Refine", "Compare"],
+        value="Refine",
+        label="Workflow mode",
+        info="Refine: ChatGPT reviews Claude's answer. Compare: both answer in parallel."
+    )
+
     # Row for the user's text entry
     with gr.Row():
         msg = gr.Textbox(
@@ -370,22 +423,30 @@ with gr.Blocks(css=custom_css, theme=gr.themes.Default()) as demo:
     model_info = gr.Markdown(f"**Models:** Claude = `{CLAUDE_MODEL}` | ChatGPT = `{OPENAI_MODEL}`")
 
     def clear_history():
-        global conversation_memory
-        conversation_memory = []
-        return [], None, "Memory cleared"
+        # In-place clear keeps every existing reference to the deque valid -
+        # no global rebind for other closures/importers to go stale against
+        conversation_memory.clear()
+        return [], None, "Memory cleared", "", ""
 
     def update_memory_indicator():
         if not conversation_memory:
             return "No conversation history"
-        return f"Memory: {len(conversation_memory)} entries from current session"
+        version = history_pack_version(format_conversation_history())
+        return f"Memory: {len(conversation_memory)} entries from current session (pack {version})"
 
     # Connect components
-    msg.submit(chat_interface, [msg, file_upload, chatbot], [msg, file_upload, chatbot])
-    submit_btn.click(chat_interface, [msg, file_upload, chatbot], [msg, file_upload, chatbot])
-    clear.click(clear_history, inputs=[], outputs=[chatbot, file_upload, memory_indicator])
+    msg.submit(chat_interface, [msg, file_upload, mode, chatbot],
+               [msg, file_upload, chatbot, claude_panel, chatgpt_panel],
+               concurrency_limit=QUEUE_CONCURRENCY)
+    submit_btn.click(chat_interface, [msg, file_upload, mode, chatbot],
+                     [msg, file_upload, chatbot, claude_panel, chatgpt_panel],
+                     concurrency_limit=QUEUE_CONCURRENCY)
+    clear.click(clear_history, inputs=[],
+                outputs=[chatbot, file_upload, memory_indicator, claude_panel, chatgpt_panel])
     
     # Update memory indicator periodically
     demo.load(update_memory_indicator, inputs=None, outputs=[memory_indicator], every=5)
+    demo.load(warm_pool_once, inputs=None, outputs=None)
 
     # Tips section
     with gr.Accordion("Tips for Effective Prompts", open=False):
@@ -430,6 +491,8 @@ with gr.Blocks(css=custom_css, theme=gr.themes.Default()) as demo:
 
 # Launch with a local URL
 if __name__ == "__main__":
-    print(f"✨ Starting AI Collaboration between Claude ({claude_display}) and ChatGPT ({openai_display})")
+    print(f"✨ Starting AI Collaboration between Claude ({CLAUDE_DISPLAY}) and ChatGPT ({OPENAI_DISPLAY})")
     print("📊 Access the web interface at http://127.0.0.1:7860")
-    demo.queue().launch(server_name="127.0.0.1", server_port=7860, share=True)
\ No newline at end of file
+    demo.queue(default_concurrency_limit=QUEUE_CONCURRENCY, max_size=QUEUE_MAX_SIZE).launch(
+        server_name="127.0.0.1", server_port=7860, share=True
+    )
\ No newline at end of file
@@ -0,0 +1,926 @@
+import asyncio
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import re
+import sqlite3
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+import httpx
+import orjson
+import tenacity
+from openai import (  # Modern OpenAI client and its error taxonomy
+    AsyncOpenAI,
+    APIConnectionError,
+    InternalServerError,
+    AuthenticationError as OpenAIAuthenticationError,
+    RateLimitError as OpenAIRateLimitError,
+)
+from anthropic import (
+    AsyncAnthropic,
+    AuthenticationError,
+    APIError,
+    RateLimitError,
+    APIConnectionError as AnthropicAPIConnectionError,
+    InternalServerError as AnthropicInternalServerError,
+)
+from dotenv import load_dotenv
+
+"""
+llm_engine.py
+
+Shared engine for the multi-LLM workflow: API clients, retry/backoff,
+response caching, prompt batching and the Claude -> ChatGPT collaboration
+pipeline. The command-line interface (multi_model_workflow.py) and the web
+interface (chat_gui.py) are thin layers over this module, so the model
+calls can't drift between the two entry points.
+"""
+
+# Non-blocking diagnostics: the hot path only enqueues log records; a
+# background listener thread does the formatting and the stdout flush, so
+# concurrent coroutines never serialize on the stream lock the way they
+# would behind print()
+_log_queue = queue.Queue(-1)
+logger = logging.getLogger("multi_llm_workflow")
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# Load .env if present
+load_dotenv()
+
+# Grab keys and configuration from environment
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Check for API keys
+if not ANTHROPIC_API_KEY:
+    print("ERROR: Missing ANTHROPIC_API_KEY environment variable.")
+    print("Make sure to create a .env file with your API keys.")
+    sys.exit(1)
+if not OPENAI_API_KEY:
+    print("ERROR: Missing OPENAI_API_KEY environment variable.")
+    print("Make sure to create a .env file with your API keys.")
+    sys.exit(1)
+
+# Get model names from environment variables with defaults
+CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-3-7-sonnet-20250219")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "o3-mini")
+
+logger.info("Using Claude model: %s", CLAUDE_MODEL)
+logger.info("Using OpenAI model: %s", OPENAI_MODEL)
+
+# Display names are embedded in every streamed chunk - compute them once here
+# instead of re-splitting the model id on each yield
+CLAUDE_DISPLAY = CLAUDE_MODEL.split('-')[2].capitalize() if '-' in CLAUDE_MODEL else CLAUDE_MODEL
+OPENAI_DISPLAY = OPENAI_MODEL.replace("-", " ").title()
+
+# Static HTML fragments for the chat transcript, formatted once. Streaming
+# re-emits the transcript on every chunk, so per-chunk work should be a
+# list-join of these constants plus the accumulated text, not a re-parsed
+# multiline f-string.
+CLAUDE_HEADER = f"<div class='claude-message'><h3>🟣 Claude ({CLAUDE_DISPLAY})</h3>\n\n"
+CHATGPT_HEADER = f"<div class='chatgpt-message'><h3>🟢 ChatGPT ({OPENAI_DISPLAY})</h3>\n\n"
+MESSAGE_FOOTER = "\n</div>\n"
+
+# One HTTP/2 keep-alive connection pool shared by both SDK clients, so
+# consecutive calls reuse warm TLS connections instead of handshaking again
+# and concurrent streams multiplex over the same connection. The clients are
+# built exactly once at import - never per call - so the pool actually warms;
+# size it alongside the UI's queue concurrency when tuning for load.
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(600.0, connect=10.0),
+    limits=httpx.Limits(
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    ),
+)
+
+# Initialize async API clients so independent calls can overlap on the event
+# loop. SDK-internal retries are disabled (max_retries=0): the engine's own
+# tenacity policy owns backoff, and letting both layers retry would multiply
+# the attempts against an already rate-limited account.
+anthropic_client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY, http_client=http_client, max_retries=0)
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)  # Modern OpenAI client
+
+async def prewarm_connections():
+    """
+    Open a TLS connection to each provider before the first real request, so
+    the first user doesn't pay DNS + TCP + TLS (~hundreds of ms) on top of
+    model latency. Any response - even a 4xx - means the connection is up;
+    errors are ignored. Must run on the event loop that will serve traffic,
+    since pooled connections belong to their loop.
+    """
+    await asyncio.gather(
+        http_client.get(str(anthropic_client.base_url), timeout=5.0),
+        http_client.get(str(openai_client.base_url), timeout=5.0),
+        return_exceptions=True,
+    )
+
+def _close_http_client():
+    """Drain the shared pool at interpreter exit so connections close cleanly"""
+    try:
+        asyncio.run(http_client.aclose())
+    except Exception:
+        pass  # interpreter is going down anyway
+
+atexit.register(_close_http_client)
+
+# Response cache configuration. The system prompts run at non-zero temperature,
+# so identical prompts can legitimately produce different answers - caching is
+# therefore opt-in via RESPONSE_CACHE=1 rather than always on.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "128"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Both caches write through to a small SQLite file so a restart (common in
+# dev) doesn't throw away accumulated hits. The insert rate is a handful of
+# rows per turn, so the synchronous commits are negligible.
+CACHE_DB_PATH = os.getenv("CACHE_DB", "llm_cache.db")
+_cache_db = None
+
+def _init_cache_db():
+    global _cache_db
+    _cache_db = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+    _cache_db.execute(
+        "CREATE TABLE IF NOT EXISTS exact_cache (k TEXT PRIMARY KEY, text TEXT, ts REAL)"
+    )
+    _cache_db.execute(
+        "CREATE TABLE IF NOT EXISTS semantic_cache ("
+        "k TEXT PRIMARY KEY, emb BLOB, html TEXT, claude TEXT, chatgpt TEXT, ts REAL)"
+    )
+    _cache_db.commit()
+
+# Maps cache key -> (stored_at, full response text), LRU-evicted first
+_response_cache = OrderedDict()
+
+def response_cache_key(model, system_prompt, user_prompt, temperature=None):
+    """Build a deterministic cache key from everything that shapes the response"""
+    # orjson serializes straight to bytes, so the key never round-trips
+    # through a Python str before hashing
+    payload = orjson.dumps(
+        {"model": model, "system": system_prompt, "user": user_prompt, "temperature": temperature},
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+def response_cache_get(key):
+    """Return the cached response for key, or None. Refreshes LRU order on hit."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, text = entry
+    if time.monotonic() - stored_at > RESPONSE_CACHE_TTL:
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return text
+
+def response_cache_put(key, text):
+    """Store a completed response, evicting stale and least-recently-used entries"""
+    if not RESPONSE_CACHE_ENABLED or not text or text.startswith("⚠️"):
+        return
+    now = time.monotonic()
+    _response_cache[key] = (now, text)
+    _response_cache.move_to_end(key)
+    # Amortized sweep: the LRU end holds the coldest entries, so expired ones
+    # cluster there - drop them before falling back to size-based eviction
+    while _response_cache:
+        oldest_key, (stored_at, _) = next(iter(_response_cache.items()))
+        if now - stored_at > RESPONSE_CACHE_TTL:
+            del _response_cache[oldest_key]
+        else:
+            break
+    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+    if _cache_db is not None:
+        _cache_db.execute(
+            "INSERT OR REPLACE INTO exact_cache VALUES (?, ?, ?)", (key, text, time.time())
+        )
+        _cache_db.commit()
+
+# Semantic cache: catches paraphrases the exact cache misses ("write
+# fizzbuzz" vs "fizzbuzz in python") by embedding the prompt and comparing
+# cosine similarity against stored turns. Costs one cheap embeddings call per
+# prompt and replays a non-deterministic answer, so it's opt-in like the
+# exact cache. The few hundred stored vectors don't warrant a numpy
+# dependency - a Python dot product over a bounded deque is plenty.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Bounded list of (int8 vector, scale, cached result), oldest evicted first.
+# Vectors are quantized per-entry: scale * q reconstructs the unit vector to
+# well within the similarity threshold's tolerance, at a quarter of the
+# float32 footprint per stored prompt.
+_semantic_cache = deque(maxlen=SEMANTIC_CACHE_SIZE)
+
+def _quantize_vector(vector):
+    """Per-vector int8 quantization; scale * q approximates the original"""
+    scale = max(abs(x) for x in vector) / 127.0
+    if scale == 0.0:
+        scale = 1.0
+    quantized = array("b", (round(x / scale) for x in vector))
+    return quantized, scale
+
+async def _embed_prompt(text):
+    """Embed text and normalize to a unit vector so similarity is a dot product"""
+    await openai_bucket.acquire(len(text) // 4 + 1)
+    async with openai_semaphore:
+        response = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    vector = response.data[0].embedding
+    norm = sum(x * x for x in vector) ** 0.5
+    return [x / norm for x in vector]
+
+async def semantic_cache_lookup(user_prompt):
+    """
+    Return (cached result or None, prompt vector or None). The vector is
+    handed back so a later store doesn't have to re-embed the prompt.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
+    try:
+        vector = await _embed_prompt(user_prompt)
+    except Exception as e:
+        logger.warning("Semantic cache embedding failed, skipping lookup: %s", str(e))
+        return None, None
+    best, best_similarity = None, 0.0
+    for quantized, scale, cached_result in _semantic_cache:
+        similarity = scale * sum(a * b for a, b in zip(vector, quantized))
+        if similarity > best_similarity:
+            best_similarity, best = similarity, cached_result
+    if best_similarity >= SEMANTIC_CACHE_THRESHOLD:
+        return best, vector
+    return None, vector
+
+def semantic_cache_store(vector, result):
+    """Remember a completed turn for future near-duplicate prompts"""
+    if vector is None or "⚠️" in result.html:
+        return
+    quantized, scale = _quantize_vector(vector)
+    _semantic_cache.append((quantized, scale, result))
+    if _cache_db is not None:
+        blob = array("f", vector).tobytes()
+        _cache_db.execute(
+            "INSERT OR REPLACE INTO semantic_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                hashlib.sha256(blob).hexdigest(),
+                blob,
+                result.html,
+                result.claude_text,
+                result.chatgpt_text,
+                time.time(),
+            ),
+        )
+        # Keep the table at the same cap as the in-memory deque; without
+        # this the file grows without bound across sessions
+        _cache_db.execute(
+            "DELETE FROM semantic_cache WHERE k NOT IN "
+            "(SELECT k FROM semantic_cache ORDER BY ts DESC LIMIT ?)",
+            (SEMANTIC_CACHE_SIZE,),
+        )
+        _cache_db.commit()
+
+# Rough cap on how much of Claude's output is forwarded to the refine call,
+# using the ~4 chars/token heuristic to bound per-call cost
+MAX_REFINE_INPUT_CHARS = int(os.getenv("MAX_REFINE_INPUT_TOKENS", "4000")) * 4
+
+# Retry policy for transient API failures. tenacity handles the exponential
+# backoff with await asyncio.sleep, so a waiting request never blocks the
+# event loop (and other queued users) the way time.sleep did. The randomized
+# wait de-synchronizes concurrent sessions that got rate-limited together,
+# so they don't all hammer the provider again on the same schedule.
+MAX_RETRIES = 3
+
+# Jittered exponential backoff, used when the provider doesn't say how long
+_fallback_wait = tenacity.wait_random_exponential(multiplier=2, max=30)
+
+def _wait_for_retry(retry_state):
+    """
+    Wait exactly as long as the provider's Retry-After header asks, when one
+    is present - guessing shorter burns a doomed call, guessing longer adds
+    latency. Falls back to jittered exponential backoff otherwise.
+    """
+    exc = retry_state.outcome.exception()
+    response = getattr(exc, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return _fallback_wait(retry_state)
+
+def retry_policy(*exception_types):
+    """Build an AsyncRetrying backoff loop for the given transient exceptions"""
+    return tenacity.AsyncRetrying(
+        wait=_wait_for_retry,
+        stop=tenacity.stop_after_attempt(MAX_RETRIES),
+        retry=tenacity.retry_if_exception_type(exception_types),
+        before_sleep=lambda rs: logger.info(
+            "Transient API error. Retrying in %.0f seconds...", rs.next_action.sleep
+        ),
+        reraise=True,
+    )
+
+# Proactive rate limiting. Retries only kick in after a 429 has already
+# wasted a round-trip; the bucket instead delays sending until request and
+# token budget are available, sized to the account's per-minute limits.
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "40"))
+RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", "16000"))
+
+class TokenBucket:
+    """
+    Dual leaky bucket (requests/min and tokens/min) refilled continuously
+    from time.monotonic(). acquire() sleeps on the event loop until both
+    budgets cover the call, so throttled requests never block other sessions.
+    """
+
+    def __init__(self, rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens):
+        """Wait until one request plus `tokens` tokens of budget is available"""
+        # The bucket never refills past tpm, so an estimate above capacity
+        # (a big batch, or a low RATE_LIMIT_TPM with a file-bearing prompt)
+        # would otherwise loop forever; let it through at a full bucket
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.requests >= 1.0 and self.tokens >= tokens:
+                    self.requests -= 1.0
+                    self.tokens -= tokens
+                    return
+                wait_requests = max(0.0, (1.0 - self.requests) * 60.0 / self.rpm)
+                wait_tokens = max(0.0, (tokens - self.tokens) * 60.0 / self.tpm)
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.05))
+
+# One bucket per provider - their limits are independent
+claude_bucket = TokenBucket()
+openai_bucket = TokenBucket()
+
+# Hard cap on in-flight requests per provider. The buckets pace the per-minute
+# spend; the semaphores bound instantaneous concurrency, so a burst of queued
+# sessions can't land hundreds of simultaneous calls that all 429 together.
+claude_semaphore = asyncio.Semaphore(int(os.getenv("CLAUDE_MAX_CONCURRENCY", "20")))
+openai_semaphore = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENCY", "50")))
+
+# Micro-batching configuration. When several users submit at the same time
+# (demo.queue() allows this), coalescing their prompts into one API call
+# spends a single request against the provider rate limit instead of N.
+# Batched calls can't stream and bypass the collaboration persona framing,
+# so this is opt-in via PROMPT_BATCHING=1.
+PROMPT_BATCHING_ENABLED = os.getenv("PROMPT_BATCHING", "0") == "1"
+PROMPT_BATCH_SIZE = int(os.getenv("PROMPT_BATCH_SIZE", "4"))
+PROMPT_BATCH_WAIT_MS = int(os.getenv("PROMPT_BATCH_WAIT_MS", "50"))
+
+class PromptBatcher:
+    """
+    Coalesces concurrent prompts into a single Claude request.
+
+    Callers await submit(prompt); a drain task collects up to batch_size
+    pending prompts (waiting at most max_wait_ms for stragglers), sends them
+    as one numbered list, and distributes the parsed answers back to each
+    caller's future.
+    """
+
+    def __init__(self, batch_size=PROMPT_BATCH_SIZE, max_wait_ms=PROMPT_BATCH_WAIT_MS):
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = asyncio.Queue()
+        self._drain_task = None
+
+    async def submit(self, prompt):
+        """Queue a prompt and wait for its answer from the next batch"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((prompt, future))
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch):
+        numbered = "\n".join(f"{i + 1}) {prompt}" for i, (prompt, _) in enumerate(batch))
+        instruction = (
+            "Answer each of the following numbered prompts independently. "
+            "Respond with ONLY a JSON array of strings, one complete answer "
+            "per prompt, in the same order.\n\n" + numbered
+        )
+        try:
+            await claude_bucket.acquire(len(instruction) // 4 + 1500 * len(batch))
+            async with claude_semaphore:
+                response = await anthropic_client.messages.create(
+                    model=CLAUDE_MODEL,
+                    max_tokens=1500 * len(batch),
+                    temperature=0.7,
+                    messages=[
+                        {"role": "user", "content": instruction}
+                    ]
+                )
+            answers = orjson.loads(response.content[0].text)
+            if not isinstance(answers, list) or len(answers) != len(batch):
+                raise ValueError("batched response did not match the batch size")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(f"⚠️ Error with batched Claude API call: {str(e)}")
+            return
+        for (_, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(str(answer))
+
+# Shared batcher for claude_generate when PROMPT_BATCHING=1
+claude_batcher = PromptBatcher()
+
+# The persona instructions are static - only the task line varies per call.
+# Keeping them as module constants means the big blocks are built once, and
+# sending the static part verbatim on every call is what lets provider-side
+# prompt caches recognize and reuse it.
+CLAUDE_SYSTEM_STATIC = """
+    You are Claude, an AI assistant by Anthropic. You'll be collaborating with ChatGPT (by OpenAI)
+    to help solve the user's request.
+
+    Address ChatGPT directly in your response, like you're having a conversation with a colleague.
+    First, analyze the user's request (given below).
+
+    Then generate a response that:
+    1. Briefly introduces yourself to ChatGPT
+    2. Outlines your approach to solving the user's request
+    3. Provides your implementation, code, or answer
+    4. IMPORTANT: Ends by specifically asking ChatGPT to review, improve, or enhance your response
+    5. Signs off with your name "- Claude"
+
+    Keep your tone professional, clear, and collaborative.
+    """
+
+CHATGPT_REFINE_SYSTEM_STATIC = """
+    You are ChatGPT, an AI assistant by OpenAI. You're collaborating with Claude (by Anthropic)
+    on solving the user's request (given below).
+
+    Claude has provided their implementation and asked you to review it.
+
+    Your response should:
+    1. Begin with a brief greeting to Claude, addressing them by name
+    2. Provide constructive feedback on Claude's implementation
+    3. Offer specific improvements, enhancements, or corrections
+    4. Include a complete, improved implementation when applicable (especially for code)
+    5. End with a friendly sign-off like "- ChatGPT"
+
+    Keep your tone positive, helpful, and collaborative, like you're working with a respected colleague.
+    """
+
+CHATGPT_DIRECT_SYSTEM_STATIC = """
+    You are ChatGPT, an AI assistant by OpenAI. Solve the user's request (given below) yourself.
+
+    Provide a clear, complete answer (including working code when applicable)
+    and end with a friendly sign-off like "- ChatGPT".
+    """
+
+async def claude_generate(prompt, task_description):
+    """
+    Stream a response from Claude using the Messages API with a conversational tone
+    where Claude addresses ChatGPT directly. Yields incremental text chunks so the
+    UI can render tokens as they arrive instead of waiting for the full completion.
+    """
+    claude_system_prompt = f"{CLAUDE_SYSTEM_STATIC}\n    The user's request: {task_description}\n"
+
+    # The static persona block carries cache_control so Anthropic serves its
+    # prefill from the provider-side prompt cache (~10% of normal input cost)
+    # across every call; only the short task line is tokenized fresh
+    claude_system_blocks = [
+        {"type": "text", "text": CLAUDE_SYSTEM_STATIC, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": f"\n    The user's request: {task_description}\n"},
+    ]
+
+    cache_key = response_cache_key(CLAUDE_MODEL, claude_system_prompt, prompt, temperature=0.7)
+    cached = response_cache_get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    # Under concurrent load, trade streaming for a single coalesced API call.
+    # Batched answers come from the JSON-array framing with no persona
+    # prompt, so they must not populate the streaming-path cache key - a
+    # later non-batched run would replay a persona-less answer.
+    if PROMPT_BATCHING_ENABLED:
+        yield await claude_batcher.submit(prompt)
+        return
+
+    # Estimated spend: prompt at ~4 chars/token plus the output cap
+    await claude_bucket.acquire(len(claude_system_prompt + prompt) // 4 + 1500)
+
+    # Chunks collect in a list and join once at the end - the accumulated
+    # text is only needed whole when it goes into the cache. Only transient
+    # failures are retried; auth and malformed-request errors would fail
+    # identically three times and just add the backoff on top.
+    chunks = []
+    started_streaming = False
+    try:
+        async for attempt in retry_policy(RateLimitError, AnthropicAPIConnectionError, AnthropicInternalServerError):
+            with attempt:
+                try:
+                    # The semaphore is held for the whole stream - a request
+                    # counts against concurrency until its last token
+                    async with claude_semaphore, anthropic_client.messages.stream(
+                        model=CLAUDE_MODEL,
+                        max_tokens=1500,
+                        temperature=0.7,
+                        system=claude_system_blocks,
+                        messages=[
+                            {"role": "user", "content": prompt}
+                        ]
+                    ) as stream:
+                        async for text in stream.text_stream:
+                            started_streaming = True
+                            chunks.append(text)
+                            yield text
+                except (RateLimitError, AnthropicAPIConnectionError, AnthropicInternalServerError) as e:
+                    # Retrying after tokens were already yielded would
+                    # duplicate output, so only let tenacity retry a cold start
+                    if started_streaming:
+                        yield f"⚠️ Error with Claude API: {str(e)}"
+                        return
+                    raise
+        response_cache_put(cache_key, "".join(chunks))
+
+    except RateLimitError:
+        yield "⚠️ Error: Claude API rate limit exceeded. Please try again later."
+    except AuthenticationError:
+        yield "⚠️ Error: Claude API authentication failed. Please check your API key."
+    except APIError as e:
+        yield f"⚠️ Error with Claude API: {str(e)}"
+    except Exception as e:
+        yield f"⚠️ Unexpected error with Claude API: {str(e)}"
+
+async def _chatgpt_stream(chatgpt_system_prompt, user_content):
+    """
+    Shared streaming path for the ChatGPT personas: cache lookup, retry with
+    backoff, then incremental SSE chunks. Yields text deltas as they arrive.
+    """
+    cache_key = response_cache_key(OPENAI_MODEL, chatgpt_system_prompt, user_content)
+    cached = response_cache_get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    # Estimated spend: prompt at ~4 chars/token plus the output cap
+    await openai_bucket.acquire(len(chatgpt_system_prompt + user_content) // 4 + 1500)
+
+    # Same list-accumulate-join-once pattern as the Claude side. Only
+    # transient failures are worth retrying; auth and malformed-request
+    # errors would fail identically three times and just add ~14s of backoff.
+    chunks = []
+    started_streaming = False
+    try:
+        async for attempt in retry_policy(OpenAIRateLimitError, APIConnectionError, InternalServerError):
+            with attempt:
+                try:
+                    # Held for the whole stream, like the Claude side
+                    async with openai_semaphore:
+                        # Using modern OpenAI client format with server-sent events
+                        response = await openai_client.chat.completions.create(
+                            model=OPENAI_MODEL,
+                            # temperature=0.5,
+                            stream=True,
+                            messages=[
+                                {
+                                    "role": "system",
+                                    "content": chatgpt_system_prompt
+                                },
+                                {
+                                    "role": "user",
+                                    "content": user_content
+                                }
+                            ]
+                        )
+
+                        async for chunk in response:
+                            started_streaming = True
+                            if chunk.choices:
+                                delta = chunk.choices[0].delta.content or ""
+                                chunks.append(delta)
+                                yield delta
+                except (OpenAIRateLimitError, APIConnectionError, InternalServerError) as e:
+                    # Same cold-start-only rule as the Claude side
+                    if started_streaming:
+                        yield f"⚠️ Error with OpenAI API: {str(e)}"
+                        return
+                    raise
+        response_cache_put(cache_key, "".join(chunks))
+
+    except OpenAIRateLimitError:
+        yield "⚠️ Error: OpenAI API rate limit exceeded. Please try again later."
+    except OpenAIAuthenticationError:
+        yield "⚠️ Error: OpenAI API authentication failed. Please check your API key."
+    except Exception as e:
+        yield f"⚠️ Error with OpenAI API: {str(e)}"
+
+async def chatgpt_refine(claude_response, task_description):
+    """
+    Stream ChatGPT's refinement of Claude's output, with ChatGPT responding
+    directly to Claude. Yields incremental text chunks as they arrive.
+    """
+    chatgpt_system_prompt = f"{CHATGPT_REFINE_SYSTEM_STATIC}\n    The user's request: {task_description}\n"
+
+    async for delta in _chatgpt_stream(chatgpt_system_prompt, claude_response):
+        yield delta
+
+async def chatgpt_direct(prompt, task_description):
+    """
+    Stream ChatGPT's own answer to the user's request, independent of Claude.
+    Used by the parallel compare mode, where both models answer side by side.
+    """
+    chatgpt_system_prompt = f"{CHATGPT_DIRECT_SYSTEM_STATIC}\n    The user's request: {task_description}\n"
+
+    async for delta in _chatgpt_stream(chatgpt_system_prompt, prompt):
+        yield delta
+
+# Greetings and acknowledgements don't need the full two-model pipeline;
+# they get a single short Claude reply instead of two streamed completions
+TRIVIAL_PROMPT_RE = re.compile(
+    r"^(hi|hello|hey|yo|thanks|thank you|ok|okay|cool|nice|good (morning|afternoon|evening))[\s!.,]*$",
+    re.IGNORECASE,
+)
+
+def is_trivial_prompt(user_prompt):
+    """Return True for smalltalk that doesn't warrant the collaboration"""
+    return bool(TRIVIAL_PROMPT_RE.match(user_prompt.strip()))
+
+# Prompts past this size get rejected outright rather than truncated - a
+# silently cut-off question produces a confidently wrong answer
+MAX_PROMPT_CHARS = int(os.getenv("MAX_PROMPT_CHARS", "10000"))
+
+def gatekeeper_reply(user_prompt):
+    """
+    Canned reply for prompts that shouldn't reach a model at all - empty or
+    near-empty input and oversized pastes. Returns None for normal prompts.
+    Smalltalk is handled separately by the quick-reply path, so short
+    greetings ("hi", "ok") are exempt from the minimum-length gate.
+    """
+    if len(user_prompt.strip()) < 3 and not is_trivial_prompt(user_prompt):
+        return (
+            "Please enter a question or task and I'll get both models working on it. "
+            "For example: \"Write a Python function that checks if a number is prime\"."
+        )
+    if len(user_prompt) > MAX_PROMPT_CHARS:
+        return (
+            f"⚠️ That prompt is {len(user_prompt):,} characters; the limit is "
+            f"{MAX_PROMPT_CHARS:,}. Please shorten it, or attach the long part as a file."
+        )
+    return None
+
+async def quick_reply(user_prompt):
+    """One cheap, tightly capped Claude call for trivial prompts"""
+    try:
+        await claude_bucket.acquire(len(user_prompt) // 4 + 150)
+        async with claude_semaphore:
+            response = await anthropic_client.messages.create(
+                model=CLAUDE_MODEL,
+                max_tokens=150,
+                temperature=0.7,
+                system="You are Claude, fronting a Claude + ChatGPT collaboration demo. "
+                       "Reply to smalltalk briefly and invite the user to pose a real task.",
+                messages=[
+                    {"role": "user", "content": user_prompt}
+                ]
+            )
+        return response.content[0].text
+    except Exception as e:
+        return f"⚠️ Error with Claude API: {str(e)}"
+
+@dataclass
+class StreamUpdate:
+    """
+    One streamed update from a workflow: the rendered transcript plus the raw
+    per-model text so far, so the UI never has to parse text back out of HTML.
+    """
+    html: str
+    claude_text: str = ""
+    chatgpt_text: str = ""
+
+def build_prompt(user_prompt, file_content=None, conversation_context=""):
+    """Fold prior conversation context and any attached file into one prompt"""
+    parts = []
+    if conversation_context:
+        parts.append(conversation_context)
+    parts.append(user_prompt)
+    if file_content:
+        parts.append(f"\n--- Attached file content ---\n{file_content}\n--- End of attached file ---")
+    return "\n".join(parts)
+
+# Speculative warm-up: while Claude streams, a one-token ChatGPT call sends
+# the refine system prompt ahead of time, warming the HTTP connection and the
+# provider-side prompt-prefix cache for the real refine call that follows.
+# It spends a tiny extra request per turn, so it's opt-in.
+SPECULATIVE_WARMUP_ENABLED = os.getenv("SPECULATIVE_WARMUP", "0") == "1"
+
+async def _warm_refine_path(task_description):
+    """Fire-and-forget priming of the refine call; failures are ignored"""
+    try:
+        await openai_bucket.acquire(len(CHATGPT_REFINE_SYSTEM_STATIC) // 4 + 1)
+        async with openai_semaphore:
+            await openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                max_completion_tokens=1,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": f"{CHATGPT_REFINE_SYSTEM_STATIC}\n    The user's request: {task_description}\n"
+                    },
+                    {"role": "user", "content": "Acknowledge that you are ready to review."}
+                ]
+            )
+    except Exception:
+        # Purely speculative - a failed warm-up must never affect the turn
+        pass
+
+async def ai_collaboration(user_prompt, file_content=None, conversation_context=""):
+    """
+    Facilitates a conversation between Claude and ChatGPT to solve the user's
+    prompt, optionally enriched with uploaded file content and the session's
+    conversation history. Yields progressively updated HTML for the chat UI.
+    """
+    # Empty or oversized prompts get a canned reply - zero model calls
+    canned = gatekeeper_reply(user_prompt)
+    if canned is not None:
+        yield StreamUpdate(canned)
+        return
+
+    # Smalltalk short-circuits to one capped call instead of the full pipeline
+    if is_trivial_prompt(user_prompt):
+        reply = await quick_reply(user_prompt)
+        yield StreamUpdate("".join((CLAUDE_HEADER, reply, MESSAGE_FOOTER)), claude_text=reply)
+        return
+
+    # A near-duplicate of an earlier prompt replays its stored turn outright.
+    # Only bare prompts participate: an attached file or injected history
+    # changes the right answer without changing the embedded prompt text, so
+    # a match would replay an answer to different material.
+    semantic_hit, semantic_vector = None, None
+    if not file_content and not conversation_context:
+        semantic_hit, semantic_vector = await semantic_cache_lookup(user_prompt)
+        if semantic_hit is not None:
+            yield semantic_hit
+            return
+
+    # Show status message
+    yield StreamUpdate("⏳ Starting AI collaboration between Claude and ChatGPT...")
+
+    prompt = build_prompt(user_prompt, file_content, conversation_context)
+
+    # While Claude types, optionally prime the refine path in the background
+    warmup_task = None
+    if SPECULATIVE_WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(_warm_refine_path(user_prompt))
+
+    # Stream Claude's initial response chunk by chunk; the transcript is
+    # rebuilt from constant fragments plus the accumulated text on each yield
+    logger.info("Claude (%s) is generating a response...", CLAUDE_MODEL)
+    claude_text = ""
+    parts = [CLAUDE_HEADER, "", MESSAGE_FOOTER]
+    async for text_chunk in claude_generate(prompt, user_prompt):
+        claude_text += text_chunk
+        parts[1] = claude_text
+        yield StreamUpdate("".join(parts), claude_text=claude_text)
+        # Give the event loop an explicit turn between transcript updates so
+        # one busy stream can't starve other queued sessions
+        await asyncio.sleep(0)
+    if warmup_task is not None:
+        await warmup_task
+    if claude_text.startswith("⚠️ Error"):
+        yield StreamUpdate(claude_text, claude_text=claude_text)
+        return
+
+    # Stream ChatGPT's refinement the same way, bounding the forwarded input
+    logger.info("ChatGPT (%s) is reviewing and refining...", OPENAI_MODEL)
+    refine_input = claude_text
+    if len(refine_input) > MAX_REFINE_INPUT_CHARS:
+        refine_input = refine_input[:MAX_REFINE_INPUT_CHARS] + "\n...[truncated due to length]..."
+    chatgpt_text = ""
+    parts.extend(["\n", CHATGPT_HEADER, "", MESSAGE_FOOTER])
+    async for text_chunk in chatgpt_refine(refine_input, user_prompt):
+        chatgpt_text += text_chunk
+        parts[5] = chatgpt_text
+        yield StreamUpdate("".join(parts), claude_text, chatgpt_text)
+        await asyncio.sleep(0)
+
+    semantic_cache_store(
+        semantic_vector, StreamUpdate("".join(parts), claude_text, chatgpt_text)
+    )
+
+async def ai_compare(user_prompt, file_content=None, conversation_context=""):
+    """
+    Ask Claude and ChatGPT the same question concurrently and stream both
+    answers side by side. Unlike ai_collaboration there is no refine
+    dependency, so the two requests run in parallel and the total wall-clock
+    is the slower of the two instead of their sum.
+    """
+    # Same gatekeeper as the refine pipeline - zero model calls
+    canned = gatekeeper_reply(user_prompt)
+    if canned is not None:
+        yield StreamUpdate(canned)
+        return
+
+    # Same smalltalk short-circuit as the refine pipeline
+    if is_trivial_prompt(user_prompt):
+        reply = await quick_reply(user_prompt)
+        yield StreamUpdate("".join((CLAUDE_HEADER, reply, MESSAGE_FOOTER)), claude_text=reply)
+        return
+
+    yield StreamUpdate("⏳ Asking Claude and ChatGPT in parallel...")
+
+    prompt = build_prompt(user_prompt, file_content, conversation_context)
+    logger.info("Claude (%s) and ChatGPT (%s) are answering in parallel...", CLAUDE_MODEL, OPENAI_MODEL)
+
+    # Both streams feed one queue; a None chunk marks a finished stream
+    queue = asyncio.Queue()
+
+    async def pump(name, stream):
+        async for text_chunk in stream:
+            await queue.put((name, text_chunk))
+        await queue.put((name, None))
+
+    tasks = [
+        asyncio.create_task(pump("claude", claude_generate(prompt, user_prompt))),
+        asyncio.create_task(pump("chatgpt", chatgpt_direct(prompt, user_prompt))),
+    ]
+
+    claude_text = ""
+    chatgpt_text = ""
+    parts = [CLAUDE_HEADER, "", MESSAGE_FOOTER, "\n", CHATGPT_HEADER, "", MESSAGE_FOOTER]
+    finished = 0
+    while finished < len(tasks):
+        name, text_chunk = await queue.get()
+        if text_chunk is None:
+            finished += 1
+            continue
+        if name == "claude":
+            claude_text += text_chunk
+            parts[1] = claude_text
+        else:
+            chatgpt_text += text_chunk
+            parts[5] = chatgpt_text
+        yield StreamUpdate("".join(parts), claude_text, chatgpt_text)
+    await asyncio.gather(*tasks)
+
+def _load_persistent_caches():
+    """Rehydrate both caches from disk so restarts keep their accumulated hits"""
+    now_wall = time.time()
+    now_mono = time.monotonic()
+    for key, text, ts in _cache_db.execute("SELECT k, text, ts FROM exact_cache"):
+        age = now_wall - ts
+        if age > RESPONSE_CACHE_TTL:
+            continue
+        # Rebase the stored wall-clock age onto the monotonic clock the TTL uses
+        _response_cache[key] = (now_mono - age, text)
+    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+    for blob, html, claude_text, chatgpt_text in _cache_db.execute(
+        "SELECT emb, html, claude, chatgpt FROM semantic_cache ORDER BY ts"
+    ):
+        quantized, scale = _quantize_vector(array("f", blob))
+        _semantic_cache.append((quantized, scale, StreamUpdate(html, claude_text, chatgpt_text)))
+
+if RESPONSE_CACHE_ENABLED or SEMANTIC_CACHE_ENABLED:
+    _init_cache_db()
+    _load_persistent_caches()